@@ -13,19 +13,30 @@ Supported labels:
 Reference: https://docs.github.com/en/webhooks/webhook-events-and-payloads
 """
 
+import asyncio
+import codecs
 import subprocess
-import json
 import hmac
 import hashlib
 import os
 import logging
+from collections import OrderedDict
+from contextlib import asynccontextmanager
 from typing import Any
-from fastapi import FastAPI, Request, HTTPException
-from fastapi.responses import JSONResponse
+import anthropic
+import httpx
+import orjson
+from aiolimiter import AsyncLimiter
+from tenacity import retry, retry_if_exception, stop_after_attempt, wait_exponential
+from fastapi import BackgroundTasks, FastAPI, Request, HTTPException
+from fastapi.responses import JSONResponse, ORJSONResponse, Response
 from dotenv import load_dotenv
+from pydantic_settings import BaseSettings
 import uvicorn
 from pathlib import Path
 
+import semantic_cache
+
 logging.basicConfig(
     level=logging.INFO,
     format="%(asctime)s - %(levelname)s - %(message)s",
@@ -33,64 +44,61 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# load_dotenv still runs first so .env values are visible to modules that
+# read the environment themselves (semantic_cache)
 load_dotenv()
 
-app = FastAPI(title="GitHub Claude Webhook")
 
+class Settings(BaseSettings):
+    github_webhook_secret: str
+    github_token: str
+    port: int = 8000
+    web_concurrency: int = 2 * (os.cpu_count() or 1) + 1
+    claude_timeout: int = 300
+    claude_model: str = "claude-sonnet-4-20250514"
 
-claude_reply_signature_zh = "\n\n---\n*🔧 此回覆由 [Claude Code](https://claude.ai/code) 自動生成*"
-claude_reply_signature_en = (
-    "\n\n---\n*🔧 This reply was automatically generated by [Claude Code](https://claude.ai/code)*"
-)
 
+# Validated once at import; a missing or malformed variable fails at boot
+# instead of in the middle of handling a webhook
+settings = Settings()
 
-def post_comment(repo: str, issue_number: int, comment: str) -> bool:
-    try:
-        cmd = ["gh", "issue", "comment", str(issue_number), "--repo", repo, "--body", comment]
-        subprocess.run(cmd, capture_output=True, text=True, check=True)
-        return True
-    except subprocess.CalledProcessError as e:
-        logger.error(f"Error posting comment: {e.stderr}")
-        return False
+github_client: httpx.AsyncClient | None = None
 
 
-def get_issue_info(repo_path: Path, issue_number: int) -> dict:
-    try:
-        gh_cmd = [
-            "gh",
-            "issue",
-            "view",
-            str(issue_number),
-            "--json",
-            "title,body,author,labels,state,comments",
-        ]
-        gh_result = subprocess.run(
-            gh_cmd, cwd=repo_path, capture_output=True, text=True, check=True
-        )
-        issue_info = json.loads(gh_result.stdout)
-        logger.info(f"Viewing issue #{issue_number}: {issue_info.get('title')}...")
-        return issue_info
-    except subprocess.CalledProcessError as e:
-        logger.error(f"Error viewing issue with gh: {e.stderr}")
-        raise HTTPException(status_code=500, detail="Failed to fetch issue details")
-    except Exception as e:
-        logger.error(f"Unexpected error viewing issue: {str(e)}")
-        raise HTTPException(status_code=500, detail="Failed to fetch issue details")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global github_client
+    github_client = httpx.AsyncClient(
+        base_url="https://api.github.com",
+        http2=True,
+        limits=httpx.Limits(max_keepalive_connections=20),
+        headers={
+            "Authorization": f"bearer {settings.github_token}",
+            "Accept": "application/vnd.github+json",
+        },
+        timeout=30,
+    )
+    yield
+    await github_client.aclose()
 
 
-def extract_repo_and_issue_info(payload: dict[str, Any]) -> tuple[str, int]:
-    repo_full_name = payload.get("repository", {}).get("full_name")
-    issue_number = payload.get("issue", {}).get("number")
-    return repo_full_name, issue_number
+app = FastAPI(
+    title="GitHub Claude Webhook", lifespan=lifespan, default_response_class=ORJSONResponse
+)
 
 
-def analyze_issue_with_claude(issue_info: dict[str, Any]) -> str:
-    prompt = f"""作為一個專業的軟體開發助手，請分析以下 GitHub issue 並提供建設性的回應。
-以下是 issue 的詳細資訊，以 JSON 格式呈現：
+claude_reply_signature_zh = "\n\n---\n*🔧 此回覆由 [Claude Code](https://claude.ai/code) 自動生成*"
+claude_reply_signature_en = (
+    "\n\n---\n*🔧 This reply was automatically generated by [Claude Code](https://claude.ai/code)*"
+)
 
-{json.dumps(issue_info, ensure_ascii=False)}
+# Static system prompt for issue analysis. Marked with cache_control so repeated
+# calls within the cache TTL reuse the cached prefix instead of paying full
+# input-token cost each time.
+analyze_system_prompt = f"""作為一個專業的軟體開發助手，請分析使用者提供的 GitHub issue 並提供建設性的回應。
+使用者會以 JSON 格式提供 issue 的詳細資訊，包含標題、內容與對話歷史。
 
-請根據以上對話歷史，提供適當的回應或繼續討論，可參考以下建議：
+請根據對話歷史，提供適當的回應或繼續討論，可參考以下建議：
 1. 對這個 issue 的分析（如果是首次回應）或對最新留言的回應
 2. 建議的後續步驟或解決方向
 3. 如果需要更多資訊，請具體說明需要什麼
@@ -102,63 +110,12 @@ def analyze_issue_with_claude(issue_info: dict[str, Any]) -> str:
 {claude_reply_signature_zh}
 """
 
-    try:
-        timeout = int(os.getenv("CLAUDE_TIMEOUT", "300"))
-        result = subprocess.run(
-            ["claude", prompt],
-            capture_output=True,
-            text=True,
-            check=True,
-            timeout=timeout,
-        )
-        return f"{result.stdout.strip()}"
-    except subprocess.CalledProcessError as e:
-        logger.error(f"Claude API error: {e.stderr}")
-        return f"🤖 分析系統暫時無法使用。我會稍後查看這個 issue。{claude_reply_signature_zh}"
-    except subprocess.TimeoutExpired:
-        logger.error("Claude API timeout")
-        return f"🤖 分析處理時間過長，我會稍後查看這個 issue。{claude_reply_signature_zh}"
-    except Exception as e:
-        logger.error(f"Unexpected error: {str(e)}")
-        return f"🤖 系統發生未預期的錯誤，我會稍後查看這個 issue。{claude_reply_signature_zh}"
-
-
-def implement_issue_with_claude(
-    repo_path: Path, repo_full_name: str, issue_number: int, issue_info: dict
-) -> bool:
-    logger.info(f"Starting implementation for issue #{issue_number}: {issue_info.get('title')}...")
-    try:
-        branch_name = f"claude-implement-{issue_number}"
-
-        subprocess.run(
-            ["git", "pull", "--rebase"],
-            cwd=repo_path,
-            check=True,
-            capture_output=True,
-            text=True,
-        )
-
-        subprocess.run(
-            ["git", "branch", "-D", branch_name],
-            cwd=repo_path,
-            capture_output=True,
-            text=True,
-        )
-
-        subprocess.run(
-            ["git", "checkout", "-b", branch_name],
-            cwd=repo_path,
-            check=True,
-            capture_output=True,
-            text=True,
-        )
-
-        logger.info(f"Created branch: {branch_name}")
-
-        prompt = f"""As a professional software developer, please implement the solution based on the following GitHub issue.
+# Prompt for the implement flow, built once at import; only the issue JSON
+# is substituted per call
+implement_prompt_template = """As a professional software developer, please implement the solution based on the following GitHub issue.
 Issue Information:
 
-{json.dumps(issue_info, ensure_ascii=False)}
+{issue_data}
 
 A new branch has been created for this implementation. Please follow these steps:
 1. Analyze the issue requirements and objectives
@@ -182,186 +139,554 @@ After completing the implementation, a Pull Request will be created
 - Please describe your changes in English
 """
 
-        timeout = int(os.getenv("CLAUDE_TIMEOUT", "300"))
-        result = subprocess.run(
+# The SDK retries with exponential backoff and honors retry-after headers
+anthropic_client = anthropic.AsyncAnthropic(max_retries=5)
+
+
+issue_id_query = """
+query IssueId($owner: String!, $name: String!, $number: Int!) {
+  repository(owner: $owner, name: $name) {
+    issue(number: $number) { id }
+  }
+}
+"""
+
+add_comment_mutation = """
+mutation AddComment($subjectId: ID!, $body: String!) {
+  addComment(input: {subjectId: $subjectId, body: $body}) { clientMutationId }
+}
+"""
+
+
+# Stay under GitHub's 5000/hr primary limit; failing fast here would only
+# make GitHub redeliver the webhook and amplify the burst. The limiter is
+# per-process, so the 4500/hr budget is divided across the uvicorn workers
+github_rate_limiter = AsyncLimiter(max(4500 // settings.web_concurrency, 1), 3600)
+
+
+def is_retryable_github_error(exception: BaseException) -> bool:
+    if isinstance(exception, httpx.TransportError):
+        return True
+    if isinstance(exception, httpx.HTTPStatusError):
+        status = exception.response.status_code
+        if status in (429, 500, 502, 503, 504):
+            return True
+        return status == 403 and exception.response.headers.get("X-RateLimit-Remaining") == "0"
+    return False
+
+
+def github_retry_wait(retry_state) -> float:
+    exception = retry_state.outcome.exception()
+    if isinstance(exception, httpx.HTTPStatusError):
+        retry_after = exception.response.headers.get("Retry-After")
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), 300.0)
+    return wait_exponential(multiplier=1, max=32)(retry_state)
+
+
+github_retry = retry(
+    retry=retry_if_exception(is_retryable_github_error),
+    wait=github_retry_wait,
+    stop=stop_after_attempt(5),
+    reraise=True,
+)
+
+
+# (etag, parsed body) per REST path, LRU-bounded: comment paths embed the
+# page number, so an unbounded dict would keep a full JSON body for every
+# comment a long-running worker has ever seen. GitHub webhooks retry on
+# failure; a 304 on If-None-Match lets retries reuse the cached body without
+# spending a rate-limit point
+etag_cache: OrderedDict[str, tuple[str, Any]] = OrderedDict()
+etag_cache_max_entries = 1024
+
+
+@github_retry
+async def github_get_cached(path: str) -> Any:
+    headers = {}
+    cached = etag_cache.get(path)
+    if cached:
+        etag_cache.move_to_end(path)
+        headers["If-None-Match"] = cached[0]
+    async with github_rate_limiter:
+        response = await github_client.get(path, headers=headers)
+    if response.status_code == 304 and cached:
+        return cached[1]
+    response.raise_for_status()
+    body = response.json()
+    etag = response.headers.get("ETag")
+    if etag:
+        etag_cache[path] = (etag, body)
+        etag_cache.move_to_end(path)
+        while len(etag_cache) > etag_cache_max_entries:
+            etag_cache.popitem(last=False)
+    return body
+
+
+@github_retry
+async def github_graphql(query: str, variables: dict[str, Any]) -> dict:
+    async with github_rate_limiter:
+        response = await github_client.post(
+            "/graphql", json={"query": query, "variables": variables}
+        )
+    response.raise_for_status()
+    data = response.json()
+    if "errors" in data:
+        raise RuntimeError(f"GitHub GraphQL error: {data['errors']}")
+    return data["data"]
+
+
+# Issue node ids already resolved by get_issue_info, so post_comment can send
+# the addComment mutation directly instead of a lookup query plus a mutation
+issue_node_ids: dict[tuple[str, int], str] = {}
+
+
+async def post_comment(repo: str, issue_number: int, comment: str) -> bool:
+    try:
+        issue_id = issue_node_ids.get((repo, issue_number))
+        if issue_id is None:
+            owner, name = repo.split("/")
+            data = await github_graphql(
+                issue_id_query, {"owner": owner, "name": name, "number": issue_number}
+            )
+            issue_id = data["repository"]["issue"]["id"]
+            issue_node_ids[(repo, issue_number)] = issue_id
+        await github_graphql(add_comment_mutation, {"subjectId": issue_id, "body": comment})
+        return True
+    except Exception as e:
+        logger.error(f"Error posting comment: {e}")
+        return False
+
+
+async def get_issue_info(
+    repo_full_name: str, issue_number: int, include_comments: bool = True
+) -> dict:
+    try:
+        issue = await github_get_cached(f"/repos/{repo_full_name}/issues/{issue_number}")
+        # Long threads can be hundreds of KB but only the last comment is ever
+        # used; page straight to it instead of downloading the whole thread
+        comments = []
+        if include_comments and issue.get("comments", 0) > 0:
+            comments = await github_get_cached(
+                f"/repos/{repo_full_name}/issues/{issue_number}/comments"
+                f"?per_page=1&page={issue['comments']}"
+            )
+        issue_node_ids[(repo_full_name, issue_number)] = issue["node_id"]
+        issue_info = {
+            "id": issue["node_id"],
+            "title": issue["title"],
+            "body": issue["body"],
+            "author": {"login": issue["user"]["login"]},
+            "labels": [{"name": label["name"]} for label in issue["labels"]],
+            "state": issue["state"],
+            "comments": [
+                {
+                    "id": comment["node_id"],
+                    "body": comment["body"],
+                    "author": {"login": comment["user"]["login"]},
+                }
+                for comment in comments
+            ],
+        }
+        logger.info(f"Viewing issue #{issue_number}: {issue_info.get('title')}...")
+        return issue_info
+    except Exception as e:
+        logger.error(f"Error viewing issue: {e}")
+        raise RuntimeError("Failed to fetch issue details")
+
+
+claude_labels = {"claude-discuss", "claude-implement"}
+
+
+# The vast majority of webhook traffic is events we never act on; decide that
+# from the payload alone so ignored events cost no clone, fetch, or queueing
+def is_relevant_event(event_type: str, payload: dict[str, Any]) -> bool:
+    if event_type == "issues.labeled":
+        return payload.get("label", {}).get("name") in claude_labels
+    if event_type == "issue_comment.created":
+        issue_labels = payload.get("issue", {}).get("labels", [])
+        return any(label.get("name") == "claude-discuss" for label in issue_labels)
+    return False
+
+
+def extract_repo_and_issue_info(payload: dict[str, Any]) -> tuple[str, int]:
+    repo_full_name = payload.get("repository", {}).get("full_name")
+    issue_number = payload.get("issue", {}).get("number")
+    return repo_full_name, issue_number
+
+
+def issue_cache_key(issue_info: dict[str, Any]) -> str:
+    comments = issue_info.get("comments", [])
+    last_comment_id = comments[-1].get("id", "") if comments else ""
+    raw = f"{issue_info.get('title', '')}||{issue_info.get('body', '')}||{last_comment_id}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+async def analyze_issue_with_claude(issue_info: dict[str, Any]) -> str:
+    try:
+        response = await anthropic_client.messages.create(
+            model=settings.claude_model,
+            max_tokens=4096,
+            system=[
+                {
+                    "type": "text",
+                    "text": analyze_system_prompt,
+                    "cache_control": {"type": "ephemeral"},
+                }
+            ],
+            messages=[{"role": "user", "content": orjson.dumps(issue_info).decode()}],
+            timeout=settings.claude_timeout,
+        )
+        return response.content[0].text.strip()
+    except anthropic.APITimeoutError:
+        logger.error("Claude API timeout")
+        return f"🤖 分析處理時間過長，我會稍後查看這個 issue。{claude_reply_signature_zh}"
+    except anthropic.APIError as e:
+        logger.error(f"Claude API error: {e}")
+        return f"🤖 分析系統暫時無法使用。我會稍後查看這個 issue。{claude_reply_signature_zh}"
+    except Exception as e:
+        logger.error(f"Unexpected error: {str(e)}")
+        return f"🤖 系統發生未預期的錯誤，我會稍後查看這個 issue。{claude_reply_signature_zh}"
+
+
+# Run a subprocess without blocking the event loop; raises the same
+# exceptions as subprocess.run(check=True) so callers keep their handling
+async def run_command(
+    cmd: list[str],
+    cwd: Path | None = None,
+    check: bool = True,
+    timeout: float | None = None,
+) -> tuple[str, str]:
+    proc = await asyncio.create_subprocess_exec(
+        *cmd,
+        cwd=cwd,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    try:
+        stdout, stderr = await asyncio.wait_for(proc.communicate(), timeout)
+    except TimeoutError:
+        proc.kill()
+        await proc.communicate()
+        raise subprocess.TimeoutExpired(cmd, timeout)
+    if check and proc.returncode != 0:
+        raise subprocess.CalledProcessError(
+            proc.returncode, cmd, stdout.decode(), stderr.decode()
+        )
+    return stdout.decode(), stderr.decode()
+
+
+# Cap how much Claude output we keep so a runaway run cannot exhaust the
+# worker's memory; only the PR description is taken from it anyway
+claude_output_max_chars = 64 * 1024
+
+
+async def run_claude(cmd: list[str], cwd: Path, timeout: float) -> str:
+    proc = await asyncio.create_subprocess_exec(
+        *cmd,
+        cwd=cwd,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+
+    # Read fixed-size chunks rather than lines: line iteration raises once a
+    # single line exceeds the StreamReader limit, aborting an otherwise good
+    # run. The incremental decoder carries multi-byte UTF-8 characters across
+    # chunk boundaries so truncation is the only lossy operation
+    async def read_stdout() -> str:
+        decoder = codecs.getincrementaldecoder("utf-8")("replace")
+        chunks: list[str] = []
+        total = 0
+        while True:
+            data = await proc.stdout.read(8192)
+            if not data:
+                break
+            if total < claude_output_max_chars:
+                text = decoder.decode(data)
+                chunks.append(text[: claude_output_max_chars - total])
+                total += len(text)
+        if total < claude_output_max_chars:
+            chunks.append(decoder.decode(b"", final=True))
+        return "".join(chunks)
+
+    try:
+        stdout, stderr = await asyncio.wait_for(
+            asyncio.gather(read_stdout(), proc.stderr.read()), timeout
+        )
+    except TimeoutError:
+        proc.kill()
+        await proc.wait()
+        raise subprocess.TimeoutExpired(cmd, timeout)
+    returncode = await proc.wait()
+    if returncode != 0:
+        raise subprocess.CalledProcessError(returncode, cmd, stdout, stderr.decode())
+    return stdout
+
+
+# A local checkout is only needed by the implement flow; discussion replies
+# fetch everything over the API
+async def ensure_repo_checkout(repo_full_name: str, ssh_url: str) -> Path | None:
+    workdir = Path.home() / "workdir"
+    workdir.mkdir(exist_ok=True)
+    repo_path = workdir / repo_full_name.split("/")[-1]
+
+    if not repo_path.exists():
+        try:
+            await run_command(["git", "clone", ssh_url, "--depth", "1"], cwd=workdir)
+            logger.info(f"Cloned repository: {repo_full_name}")
+        except subprocess.CalledProcessError as e:
+            logger.error(f"Failed to clone repository {repo_full_name}: {e.stderr}")
+            return None
+    else:
+        logger.info(f"Repository already exists: {repo_path}")
+        await run_command(["git", "checkout", "main"], cwd=repo_path)
+    return repo_path
+
+
+async def implement_issue_with_claude(
+    repo_path: Path, repo_full_name: str, issue_number: int, issue_info: dict
+) -> bool:
+    logger.info(f"Starting implementation for issue #{issue_number}: {issue_info.get('title')}...")
+    try:
+        branch_name = f"claude-implement-{issue_number}"
+
+        await run_command(["git", "pull", "--rebase"], cwd=repo_path)
+
+        await run_command(["git", "branch", "-D", branch_name], cwd=repo_path, check=False)
+
+        await run_command(["git", "checkout", "-b", branch_name], cwd=repo_path)
+
+        logger.info(f"Created branch: {branch_name}")
+
+        prompt = implement_prompt_template.format(issue_data=orjson.dumps(issue_info).decode())
+
+        claude_stdout = await run_claude(
             ["claude", prompt, "--permission-mode", "bypassPermissions"],
             cwd=repo_path,
-            capture_output=True,
-            text=True,
-            check=True,
-            timeout=timeout,
+            timeout=settings.claude_timeout,
         )
         logger.info("Claude implementation completed")
 
-        subprocess.run(
-            ["git", "push", "-u", "origin", branch_name],
-            cwd=repo_path,
-            check=True,
-            capture_output=True,
-            text=True,
-        )
+        await run_command(["git", "push", "-u", "origin", branch_name], cwd=repo_path)
         logger.info(f"Pushed branch {branch_name} to remote")
 
         pr_title = f"🤖 Implement issue #{issue_number}"
-        pr_body = f"Pull request to close #{issue_number}\n" + result.stdout.strip()
+        pr_body = f"Pull request to close #{issue_number}\n" + claude_stdout.strip()
 
-        subprocess.run(
+        await run_command(
             ["gh", "pr", "create", "-t", pr_title, "-b", pr_body, "-B", "main", "-H", branch_name],
             cwd=repo_path,
-            check=True,
-            capture_output=True,
-            text=True,
         )
         logger.info(f"Pull request created for issue #{issue_number}")
         
         comment = f"🤖 我已經分析了這個 issue 並創建了實作方案！\n\n已自動創建 PR 來解決此問題。請查看並審核代碼。\n\n{claude_reply_signature_zh}"
-        post_comment(repo_full_name, issue_number, comment)
+        await post_comment(repo_full_name, issue_number, comment)
         return True
 
     except subprocess.CalledProcessError as e:
         logger.error(f"Error during implementation: {e.stderr}")
         error_comment = f"🤖 實作過程中發生錯誤：\n\n```\n{e.stderr}\n```\n\n請檢查 issue 內容或聯繫管理員。\n\n{claude_reply_signature_zh}"
-        post_comment(repo_full_name, issue_number, error_comment)
+        await post_comment(repo_full_name, issue_number, error_comment)
         return False
     except subprocess.TimeoutExpired:
         logger.error("Claude implementation timeout")
         timeout_comment = f"🤖 實作處理時間過長，已超時。\n\n這可能是因為：\n- Issue 過於複雜\n- 需要更多時間分析代碼庫\n\n請稍後重試或將問題分解為更小的任務。\n\n{claude_reply_signature_zh}"
-        post_comment(repo_full_name, issue_number, timeout_comment)
+        await post_comment(repo_full_name, issue_number, timeout_comment)
         return False
     except Exception as e:
         logger.error(f"Unexpected error during implementation: {str(e)}")
         error_comment = f"🤖 實作過程中發生未預期的錯誤。\n\n請稍後重試或聯繫管理員。\n\n{claude_reply_signature_zh}"
-        post_comment(repo_full_name, issue_number, error_comment)
+        await post_comment(repo_full_name, issue_number, error_comment)
         return False
 
 
-async def handle_claude_discuss(repo_path: Path, payload: dict[str, Any]) -> JSONResponse:
+# Comments arriving in quick succession would each start an independent
+# Claude run; a second webhook for the same issue awaits the in-flight run
+# instead of starting its own
+inflight_runs: dict[tuple[str, int], asyncio.Future] = {}
+
+
+async def run_coalesced(repo_full_name: str, issue_number: int, coro_factory) -> None:
+    key = (repo_full_name, issue_number)
+    future = inflight_runs.get(key)
+    if future is not None:
+        logger.info(f"Coalescing duplicate run for issue #{issue_number} in {repo_full_name}")
+        await future
+        return
+    future = asyncio.ensure_future(coro_factory())
+    inflight_runs[key] = future
+    try:
+        await future
+    finally:
+        inflight_runs.pop(key, None)
+
+
+async def handle_claude_discuss(payload: dict[str, Any]) -> None:
     repo_full_name, issue_number = extract_repo_and_issue_info(payload)
+    await run_coalesced(
+        repo_full_name, issue_number, lambda: discuss_issue(repo_full_name, issue_number)
+    )
+
+
+async def discuss_issue(repo_full_name: str, issue_number: int) -> None:
+    # A freshly labeled issue has no conversation to reply to; skip the
+    # comment fetch entirely
+    issue_info = await get_issue_info(repo_full_name, issue_number, include_comments=False)
+
+    embedding = await asyncio.to_thread(semantic_cache.embed_issue, issue_info)
+    claude_thoughts = (
+        await asyncio.to_thread(semantic_cache.lookup, repo_full_name, embedding)
+        if embedding
+        else None
+    )
+    if claude_thoughts is None:
+        claude_thoughts = await analyze_issue_with_claude(issue_info)
+        # Fallback replies start with "🤖 " and should not be reused for other issues
+        if embedding and not claude_thoughts.startswith("🤖 "):
+            await asyncio.to_thread(
+                semantic_cache.store, repo_full_name, embedding, claude_thoughts
+            )
 
-    issue_info = get_issue_info(repo_path, issue_number)
-    claude_thoughts = analyze_issue_with_claude(issue_info)
-    success = post_comment(repo_full_name, issue_number, claude_thoughts)
+    success = await post_comment(repo_full_name, issue_number, claude_thoughts)
 
     if not success:
-        raise HTTPException(status_code=500, detail="Failed to post comment")
+        logger.error(f"Failed to post comment for issue #{issue_number} in {repo_full_name}")
+        return
 
     logger.info(f"Comment posted successfully for issue #{issue_number} in {repo_full_name}")
-    return JSONResponse({"message": "Comment posted successfully"}, status_code=200)
 
 
-async def handle_claude_implement(repo_path: Path, payload: dict[str, Any]) -> JSONResponse:
+# Implement runs for the same repo share one working tree under ~/workdir,
+# so they must not interleave: a concurrent run would rebase and switch
+# branches under an in-flight Claude run and mix both issues' commits
+repo_locks: dict[str, asyncio.Lock] = {}
+
+
+def get_repo_lock(repo_full_name: str) -> asyncio.Lock:
+    lock = repo_locks.get(repo_full_name)
+    if lock is None:
+        lock = repo_locks.setdefault(repo_full_name, asyncio.Lock())
+    return lock
+
+
+async def handle_claude_implement(payload: dict[str, Any]) -> None:
     repo_full_name, issue_number = extract_repo_and_issue_info(payload)
+    ssh_url = payload.get("repository", {}).get("ssh_url")
 
-    issue_info = get_issue_info(repo_path, issue_number)
-    success = implement_issue_with_claude(repo_path, repo_full_name, issue_number, issue_info)
+    async with get_repo_lock(repo_full_name):
+        repo_path = await ensure_repo_checkout(repo_full_name, ssh_url)
+        if repo_path is None:
+            logger.error(f"Failed to prepare checkout for {repo_full_name}")
+            return
+
+        issue_info = await get_issue_info(repo_full_name, issue_number)
+        success = await implement_issue_with_claude(
+            repo_path, repo_full_name, issue_number, issue_info
+        )
 
     if not success:
-        raise HTTPException(status_code=500, detail="Failed to implement issue")
+        logger.error(f"Failed to implement issue #{issue_number} in {repo_full_name}")
+        return
 
     logger.info(f"Implementation completed for issue #{issue_number} in {repo_full_name}")
-    return JSONResponse({"message": "Implementation completed and PR created"}, status_code=200)
 
 
-async def handle_issues_labeled(repo_path: Path, payload: dict[str, Any]) -> JSONResponse:
+async def handle_issues_labeled(payload: dict[str, Any]) -> None:
     label = payload.get("label", {}).get("name")
     if label == "claude-discuss":
-        return await handle_claude_discuss(repo_path, payload)
+        await handle_claude_discuss(payload)
     elif label == "claude-implement":
-        return await handle_claude_implement(repo_path, payload)
+        await handle_claude_implement(payload)
     else:
         logger.info(f"Label ignored: {label}")
-        return JSONResponse({"message": f"Label ignored: {label}"}, status_code=200)
 
 
-async def handle_issue_comment_created(repo_path: Path, payload: dict[str, Any]) -> JSONResponse:
+async def handle_issue_comment_created(payload: dict[str, Any]) -> None:
     issue = payload.get("issue", {})
     issue_labels = issue.get("labels", [])
     if not any(label.get("name") == "claude-discuss" for label in issue_labels):
         logger.info(f"Issue #{issue.get('number')} not marked for claude-discuss")
-        return JSONResponse({"message": "Issue not marked for claude-discuss"}, status_code=200)
+        return
 
     repo_full_name, _ = extract_repo_and_issue_info(payload)
     issue_number = issue.get("number")
+    await run_coalesced(
+        repo_full_name, issue_number, lambda: reply_to_comment(repo_full_name, issue_number)
+    )
 
-    issue_info = get_issue_info(repo_path, issue_number)
+
+async def reply_to_comment(repo_full_name: str, issue_number: int) -> None:
+    issue_info = await get_issue_info(repo_full_name, issue_number)
     comments = issue_info.get("comments", [])
     if comments and comments[-1].get("body", "").endswith(claude_reply_signature_zh):
         logger.info(f"Issue #{issue_number} already has a Claude reply, skipping...")
-        return JSONResponse({"message": "Claude reply already exists"}, status_code=200)
+        return
+
+    # GitHub retries failed deliveries; an exact-match hit means we already
+    # analyzed this issue state, so skip or re-post without a new Claude run
+    cache_key = issue_cache_key(issue_info)
+    cached_reply = await asyncio.to_thread(semantic_cache.exact_lookup, cache_key)
+    if cached_reply is not None:
+        if any(comment.get("body") == cached_reply for comment in comments):
+            logger.info(f"Cached reply already posted for issue #{issue_number}, skipping...")
+            return
+        logger.info(f"Re-posting cached reply for issue #{issue_number}")
+        claude_thoughts = cached_reply
+    else:
+        claude_thoughts = await analyze_issue_with_claude(issue_info)
 
-    claude_thoughts = analyze_issue_with_claude(issue_info)
-    success = post_comment(repo_full_name, issue_number, claude_thoughts)
+    success = await post_comment(repo_full_name, issue_number, claude_thoughts)
 
     if not success:
-        raise HTTPException(status_code=500, detail="Failed to post reply")
+        logger.error(f"Failed to post reply for issue #{issue_number} in {repo_full_name}")
+        return
 
+    await asyncio.to_thread(semantic_cache.exact_store, cache_key, claude_thoughts)
     logger.info(f"Reply posted successfully for issue #{issue_number} in {repo_full_name}")
-    return JSONResponse({"message": "Reply posted successfully"}, status_code=200)
 
 
-@app.post("/webhook")
-async def github_webhook(request: Request):
+async def process_event(event_type: str, payload: dict[str, Any]) -> None:
     try:
-        secret = os.getenv("GITHUB_WEBHOOK_SECRET")
-        if not secret:
-            raise HTTPException(status_code=500, detail="Webhook secret not configured")
-
-        signature = request.headers.get("X-Hub-Signature-256")
-        if not signature:
-            raise HTTPException(status_code=400, detail="Missing signature header")
-
-        payload_body = await request.body()
-        expected_signature = hmac.new(
-            secret.encode("utf-8"), payload_body, hashlib.sha256
-        ).hexdigest()
-        if not hmac.compare_digest(f"sha256={expected_signature}", signature):
-            raise HTTPException(status_code=401, detail="Invalid signature")
-
-        payload = json.loads(payload_body)
-        event_type = request.headers.get("X-GitHub-Event") + "." + payload.get("action")
-
-        repository = payload.get("repository", {})
-        repo_full_name = repository.get("full_name")
-        ssh_url = repository.get("ssh_url")
-
-        workdir = Path.home() / "workdir"
-        workdir.mkdir(exist_ok=True)
-        repo_path = workdir / repo_full_name.split("/")[-1]
-
-        if not repo_path.exists():
-            try:
-                subprocess.run(
-                    ["git", "clone", ssh_url, "--depth", "1"],
-                    cwd=workdir,
-                    check=True,
-                    capture_output=True,
-                    text=True,
-                )
-                logger.info(f"Cloned repository: {repo_full_name}")
-            except subprocess.CalledProcessError as e:
-                logger.error(f"Failed to clone repository {repo_full_name}: {e.stderr}")
-                raise HTTPException(status_code=500, detail="Failed to clone repository")
-        else:
-            logger.info(f"Repository already exists: {repo_path}")
-            subprocess.run(
-                ["git", "checkout", "main"],
-                cwd=repo_path,
-                check=True,
-                capture_output=True,
-                text=True,
-            )
-
         if event_type == "issues.labeled":
-            return await handle_issues_labeled(repo_path, payload)
+            await handle_issues_labeled(payload)
         elif event_type == "issue_comment.created":
-            return await handle_issue_comment_created(repo_path, payload)
+            await handle_issue_comment_created(payload)
         else:
             logger.info(f"Event ignored: {event_type}")
-            return JSONResponse({"message": "Event ignored"}, status_code=200)
 
     except Exception as e:
-        logger.error(f"Webhook error: {e}")
-        raise HTTPException(status_code=500, detail=e)
+        logger.error(f"Error processing event {event_type}: {e}")
+
+
+@app.post("/webhook")
+async def github_webhook(request: Request, background_tasks: BackgroundTasks):
+    signature = request.headers.get("X-Hub-Signature-256")
+    if not signature:
+        raise HTTPException(status_code=400, detail="Missing signature header")
+
+    # Hash the body as it streams in instead of buffering it twice; large
+    # payloads then peak at one copy in memory and hashing overlaps the read
+    mac = hmac.new(settings.github_webhook_secret.encode("utf-8"), digestmod=hashlib.sha256)
+    payload_body = bytearray()
+    async for chunk in request.stream():
+        mac.update(chunk)
+        payload_body.extend(chunk)
+    if not hmac.compare_digest(f"sha256={mac.hexdigest()}", signature):
+        raise HTTPException(status_code=401, detail="Invalid signature")
+
+    try:
+        payload = orjson.loads(bytes(payload_body))
+    except orjson.JSONDecodeError:
+        raise HTTPException(status_code=400, detail="Invalid JSON payload")
+
+    event_type = f"{request.headers.get('X-GitHub-Event')}.{payload.get('action')}"
+
+    if not is_relevant_event(event_type, payload):
+        logger.info(f"Event ignored: {event_type}")
+        return Response(status_code=204)
+
+    background_tasks.add_task(process_event, event_type, payload)
+    return JSONResponse({"message": "Event accepted"}, status_code=202)
 
 
 @app.get("/")
@@ -370,5 +695,5 @@ async def health_check():
 
 
 if __name__ == "__main__":
-    port = int(os.getenv("PORT", "8000"))
-    uvicorn.run(app, host="0.0.0.0", port=port)
+    # 2n+1 workers so long Claude calls in one process don't starve the rest
+    uvicorn.run("main:app", host="0.0.0.0", port=settings.port, workers=settings.web_concurrency)
@@ -0,0 +1,149 @@
+"""
+Semantic response cache for issue analysis.
+
+Embeds an issue's title and body with a local embedding model served by Ollama
+and stores (embedding, reply) pairs in sqlite, namespaced per repository.
+Near-duplicate issues (duplicates, bot-filed repeats, reopened threads) can
+then reuse a recent Claude reply instead of paying for a fresh analysis.
+
+The cache is best-effort: if the embedding service is unavailable, lookups
+and stores are skipped and the caller falls back to a normal Claude call.
+
+The same sqlite database also holds an exact-match table keyed by a content
+hash, used to short-circuit webhook re-deliveries without any embedding call.
+"""
+
+import logging
+import json
+import math
+import os
+import sqlite3
+import time
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+SIMILARITY_THRESHOLD = 0.85
+CACHE_TTL_SECONDS = 24 * 60 * 60
+
+
+def _db_path() -> str:
+    return os.getenv("SEMANTIC_CACHE_DB", "semantic_cache.db")
+
+
+def _connect() -> sqlite3.Connection:
+    # WAL and a busy timeout keep concurrent workers from tripping over each
+    # other's write transactions
+    conn = sqlite3.connect(_db_path(), timeout=5)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS replies (
+            repo TEXT NOT NULL,
+            embedding TEXT NOT NULL,
+            reply TEXT NOT NULL,
+            created_at REAL NOT NULL
+        )
+        """
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS exact_replies (
+            key TEXT PRIMARY KEY,
+            reply TEXT NOT NULL,
+            created_at REAL NOT NULL
+        )
+        """
+    )
+    return conn
+
+
+def _embed(text: str) -> list[float] | None:
+    url = os.getenv("OLLAMA_URL", "http://localhost:11434")
+    model = os.getenv("EMBED_MODEL", "nomic-embed-text")
+    try:
+        response = httpx.post(
+            f"{url}/api/embeddings", json={"model": model, "prompt": text}, timeout=30
+        )
+        response.raise_for_status()
+        return response.json().get("embedding")
+    except Exception as e:
+        logger.warning(f"Embedding request failed, skipping semantic cache: {e}")
+        return None
+
+
+def _cosine_similarity(a: list[float], b: list[float]) -> float:
+    if len(a) != len(b):
+        return 0.0
+    dot = sum(x * y for x, y in zip(a, b))
+    norm_a = math.sqrt(sum(x * x for x in a))
+    norm_b = math.sqrt(sum(x * x for x in b))
+    if norm_a == 0.0 or norm_b == 0.0:
+        return 0.0
+    return dot / (norm_a * norm_b)
+
+
+def embed_issue(issue_info: dict) -> list[float] | None:
+    return _embed(f"{issue_info.get('title', '')}\n\n{issue_info.get('body', '')}")
+
+
+def lookup(repo: str, embedding: list[float]) -> str | None:
+    try:
+        with _connect() as conn:
+            conn.execute(
+                "DELETE FROM replies WHERE created_at < ?", (time.time() - CACHE_TTL_SECONDS,)
+            )
+            rows = conn.execute(
+                "SELECT embedding, reply FROM replies WHERE repo = ?", (repo,)
+            ).fetchall()
+    except sqlite3.Error as e:
+        logger.warning(f"Semantic cache lookup failed, skipping: {e}")
+        return None
+
+    best_score, best_reply = 0.0, None
+    for stored_embedding, reply in rows:
+        score = _cosine_similarity(embedding, json.loads(stored_embedding))
+        if score > best_score:
+            best_score, best_reply = score, reply
+
+    if best_score >= SIMILARITY_THRESHOLD:
+        logger.info(f"Semantic cache hit for {repo} (similarity {best_score:.3f})")
+        return best_reply
+    return None
+
+
+def store(repo: str, embedding: list[float], reply: str) -> None:
+    try:
+        with _connect() as conn:
+            conn.execute(
+                "INSERT INTO replies (repo, embedding, reply, created_at) VALUES (?, ?, ?, ?)",
+                (repo, json.dumps(embedding), reply, time.time()),
+            )
+    except sqlite3.Error as e:
+        logger.warning(f"Semantic cache store failed, skipping: {e}")
+
+
+def exact_lookup(key: str) -> str | None:
+    try:
+        with _connect() as conn:
+            conn.execute(
+                "DELETE FROM exact_replies WHERE created_at < ?",
+                (time.time() - CACHE_TTL_SECONDS,),
+            )
+            row = conn.execute("SELECT reply FROM exact_replies WHERE key = ?", (key,)).fetchone()
+    except sqlite3.Error as e:
+        logger.warning(f"Exact cache lookup failed, skipping: {e}")
+        return None
+    return row[0] if row else None
+
+
+def exact_store(key: str, reply: str) -> None:
+    try:
+        with _connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO exact_replies (key, reply, created_at) VALUES (?, ?, ?)",
+                (key, reply, time.time()),
+            )
+    except sqlite3.Error as e:
+        logger.warning(f"Exact cache store failed, skipping: {e}")